@@ -6,6 +6,7 @@ import signal
 import traceback
 
 import gevent
+import gevent.event
 import gevent.pool
 from flask_security.utils import encrypt_password
 
@@ -81,11 +82,9 @@ def add_role(email, role_name):
             logger.info("user already has role")
         db.session.commit()
 
-def sigint_handler(signum, frame):
-    # pylint: disable=global-statement
-    global KEEP_RUNNING
+def sigint_handler():
     logger.warning("SIGINT caught, attempting to exit gracefully")
-    KEEP_RUNNING = False
+    SHUTDOWN.set()
 
 def g_exception(greenlet):
     # pylint: disable=broad-except
@@ -96,7 +95,7 @@ def g_exception(greenlet):
         msg = f"{e}\n---\n{stack_trace}"
         utils.email_exception(logger, msg)
 
-KEEP_RUNNING = True
+SHUTDOWN = gevent.event.Event()
 if __name__ == "__main__":
     ch = log_utils.setup_logging(logger, logging.DEBUG)
     web.logger_setup(logging.DEBUG, ch)
@@ -134,13 +133,13 @@ if __name__ == "__main__":
         else:
             logger.info('got all vital settings')
 
-        signal.signal(signal.SIGINT, sigint_handler)
+        # use a gevent signal handler so it runs while the main greenlet is waiting on the hub
+        gevent.signal_handler(signal.SIGINT, sigint_handler)
 
         logger.info("starting greenlets")
         web_greenlet = web.WebGreenlet(g_exception)
         web_greenlet.start()
-        while KEEP_RUNNING:
-            gevent.sleep(1)
+        SHUTDOWN.wait()
         logger.info("stopping greenlets")
         web_greenlet.stop()
         logger.info("teardown logging")
@@ -13,146 +13,127 @@ from flask_limiter.util import get_remote_address
 
 SERVER_MODE_WAVES = 'waves'
 SERVER_MODE_PAYDB = 'paydb'
-MISSING_VITAL_SETTING = False
 
-# Create Flask application
-app = Flask(__name__)
-app.wsgi_app = ProxyFix(app.wsgi_app)
-all_origins = {"origins": "*"}
-cors = CORS(app, resources={r"/paydb/*": all_origins, r"/reward/*": all_origins, r"/payment_create": all_origins})
-
-if os.getenv("DEBUG"):
-    app.config["DEBUG"] = True
-
-app.config.from_pyfile("flask_config.py")
-
-if os.getenv("TESTNET"):
-    app.config["TESTNET"] = True
-else:
-    app.config["TESTNET"] = False
-if os.getenv("DATABASE_URL"):
-    app.config["SQLALCHEMY_DATABASE_URI"] = os.getenv("DATABASE_URL")
-else:
-    if app.config["TESTNET"]:
-        DATABASE_FILE = 'premio_stage_testnet.db'
-    else:
-        DATABASE_FILE = 'premio_stage.db'
-    app.config["SQLALCHEMY_DATABASE_URI"] = 'sqlite:///' + DATABASE_FILE
-if os.getenv("LOGO_URL_SRC"):
-    app.config["LOGO_URL_SRC"] = os.getenv("LOGO_URL_SRC")
-else:
-    app.config["LOGO_URL_SRC"] = "http://" + os.getenv("SERVER_NAME") + "/static/assets/img/logo.svg"
-
-if os.getenv("LOGO_EMAIL_SRC"):
-    app.config["LOGO_EMAIL_SRC"] = os.getenv("LOGO_EMAIL_SRC")
-else:
-    app.config["LOGO_EMAIL_SRC"] = "http://" + os.getenv("SERVER_NAME") + "/static/assets/img/logo.png"
-
-if os.getenv("APPLE_APP_STORE_URL"):
-    app.config["APPLE_APP_STORE_URL"] = os.getenv("APPLE_APP_STORE_URL")
-else:
-    app.config["APPLE_APP_STORE_URL"] = "https://apps.apple.com/nz/app/zap/id1445794886"
-
-if os.getenv("GOOGLE_PLAY_STORE_URL"):
-    app.config["GOOGLE_PLAY_STORE_URL"] = os.getenv("GOOGLE_PLAY_STORE_URL")
-else:
-    app.config["GOOGLE_PLAY_STORE_URL"] = "https://play.google.com/store/apps/details?id=me.zap.zapapp"
-
-if os.getenv("USE_REFERRALS"):
-    app.config["USE_REFERRALS"] = True
-else:
-    app.config["USE_REFERRALS"] = False
-#if os.getenv("REFERRAL_REWARD_TYPE_SENDER"):
-#    app.config["REFERRAL_REWARD_TYPE_SENDER"] = os.getenv("REFERRAL_REWARD_TYPE_SENDER")
-#else:
-app.config["REFERRAL_REWARD_TYPE_SENDER"] = 'fixed'
-if os.getenv("REFERRAL_REWARD_SENDER"):
-    app.config["REFERRAL_REWARD_SENDER"] = int(os.getenv("REFERRAL_REWARD_SENDER"))
-else:
-    app.config["REFERRAL_REWARD_SENDER"] = 1000
-if os.getenv("REFERRAL_REWARD_TYPE_RECIPIENT"):
-    app.config["REFERRAL_REWARD_TYPE_RECIPIENT"] = os.getenv("REFERRAL_REWARD_TYPE_RECIPIENT")
-else:
-    app.config["REFERRAL_REWARD_TYPE_RECIPIENT"] = 'fixed'
-if os.getenv("REFERRAL_REWARD_RECIPIENT"):
-    app.config["REFERRAL_REWARD_RECIPIENT"] = int(os.getenv("REFERRAL_REWARD_RECIPIENT"))
-else:
-    app.config["REFERRAL_REWARD_RECIPIENT"] = 1000
-if os.getenv("REFERRAL_RECIPIENT_MIN_SPEND"):
-    app.config["REFERRAL_RECIPIENT_MIN_SPEND"] = int(os.getenv("REFERRAL_RECIPIENT_MIN_SPEND"))
-else:
-    app.config["REFERRAL_RECIPIENT_MIN_SPEND"] = 5000
-if os.getenv("REFERRAL_ECOMMERCE_URL"):
-    app.config["REFERRAL_ECOMMERCE_URL"] = os.getenv("REFERRAL_ECOMMERCE_URL")
-else:
-    app.config["REFERRAL_ECOMMERCE_URL"] = None
-if os.getenv("REFERRAL_STORE_NAME"):
-    app.config["REFERRAL_STORE_NAME"] = os.getenv("REFERRAL_STORE_NAME")
-else:
-    app.config["REFERRAL_STORE_NAME"] = "Change My Name Inc"
-if os.getenv("REFERRAL_SPEND_ASSET"):
-    app.config["REFERRAL_SPEND_ASSET"] = os.getenv("REFERRAL_SPEND_ASSET")
-else:
-    app.config["REFERRAL_SPEND_ASSET"] = "NZD"
-
-if os.getenv("USE_STASH"):
-    app.config["USE_STASH"] = True
-else:
-    app.config["USE_STASH"] = False
-
-def set_vital_setting(env_name, setting_name=None, acceptable_values=None):
-    # pylint: disable=global-statement
-    global MISSING_VITAL_SETTING
+# boolean settings, enabled when the environment variable is set
+FLAG_SETTINGS = ["TESTNET", "USE_REFERRALS", "USE_STASH"]
+# optional settings (name -> default), unset or empty environment variables use the default
+INT_SETTINGS = {
+    "DB_POOL_SIZE": 20,
+    "DB_MAX_OVERFLOW": 20,
+    "REFERRAL_REWARD_SENDER": 1000,
+    "REFERRAL_REWARD_RECIPIENT": 1000,
+    "REFERRAL_RECIPIENT_MIN_SPEND": 5000,
+}
+STR_SETTINGS = {
+    "LOGO_URL_SRC": None,
+    "LOGO_EMAIL_SRC": None,
+    "APPLE_APP_STORE_URL": "https://apps.apple.com/nz/app/zap/id1445794886",
+    "GOOGLE_PLAY_STORE_URL": "https://play.google.com/store/apps/details?id=me.zap.zapapp",
+    "REFERRAL_REWARD_TYPE_RECIPIENT": "fixed",
+    "REFERRAL_ECOMMERCE_URL": None,
+    "REFERRAL_STORE_NAME": "Change My Name Inc",
+    "REFERRAL_SPEND_ASSET": "NZD",
+}
+
+def set_vital_setting(flask_app, env, env_name, setting_name=None, acceptable_values=None):
+    # returns False if the setting is missing or not acceptable
     if not setting_name:
         setting_name = env_name
-    if os.getenv(env_name):
-        value = app.config[setting_name] = os.getenv(env_name)
-        app.config[env_name] = os.getenv(env_name)
-        if acceptable_values and value not in acceptable_values:
-            print(env_name + " not in range of acceptable values: " + str(acceptable_values))
-            MISSING_VITAL_SETTING = True
-    else:
+    value = env.get(env_name)
+    if not value:
         print("no " + env_name)
-        MISSING_VITAL_SETTING = True
-
-set_vital_setting("SERVER_MODE", acceptable_values=[SERVER_MODE_WAVES, SERVER_MODE_PAYDB])
-set_vital_setting("DEEP_LINK_SCHEME")
-if app.config["SERVER_MODE"] == SERVER_MODE_WAVES:
-    set_vital_setting("ASSET_NAME")
-    if app.config["TESTNET"]:
-        app.config["WAVESEXPLORER"] = 'https://testnet.wavesexplorer.com'
+        return False
+    flask_app.config[setting_name] = flask_app.config[env_name] = value
+    if acceptable_values and value not in acceptable_values:
+        print(env_name + " not in range of acceptable values: " + str(acceptable_values))
+        return False
+    return True
+
+def _configure_database(flask_app, env):
+    database_url = env.get("DATABASE_URL")
+    if database_url:
+        flask_app.config["SQLALCHEMY_DATABASE_URI"] = database_url
+    elif env.get("TESTING"):
+        # in-memory database, flask-sqlalchemy shares a single connection via StaticPool
+        flask_app.config["SQLALCHEMY_DATABASE_URI"] = 'sqlite://'
     else:
-        app.config["WAVESEXPLORER"] = 'https://wavesexplorer.com'
-    set_vital_setting("NODE_BASE_URL")
-    set_vital_setting("WALLET_SEED")
-    set_vital_setting("WALLET_ADDRESS")
-    set_vital_setting("ASSET_ID")
-    set_vital_setting("ASSET_MASTER_PUBKEY")
-    set_vital_setting("TX_SIGNERS")
-    try:
-        app.config["TX_SIGNERS"] = json.loads(app.config["TX_SIGNERS"])
-    except:
-        raise Exception('TX_SIGNERS is not valid json') from None
-
-    # set pywaves to offline mode and testnet
-    pywaves.setOffline()
-    if app.config["TESTNET"]:
-        pywaves.setChain("testnet")
-
-else: # paydb
-    set_vital_setting("ASSET_NAME")
-    set_vital_setting("OPERATIONS_ACCOUNT")
-
-set_vital_setting("ADMIN_EMAIL")
-set_vital_setting("FROM_EMAIL", "SECURITY_EMAIL_SENDER")
-set_vital_setting("FROM_NAME")
-
-set_vital_setting("SESSION_KEY", "SECRET_KEY")
-set_vital_setting("PASSWORD_SALT", "SECURITY_PASSWORD_SALT")
-set_vital_setting("SENDGRID_API_KEY", "MAIL_SENDGRID_API_KEY")
-set_vital_setting("SERVER_NAME")
-set_vital_setting("FIREBASE_CREDENTIALS")
+        if flask_app.config["TESTNET"]:
+            database_file = 'premio_stage_testnet.db'
+        else:
+            database_file = 'premio_stage.db'
+        flask_app.config["SQLALCHEMY_DATABASE_URI"] = 'sqlite:///' + database_file
+    if not flask_app.config["SQLALCHEMY_DATABASE_URI"].startswith('sqlite'):
+        # sqlite uses its own pool classes which reject these options
+        flask_app.config["SQLALCHEMY_ENGINE_OPTIONS"] = {"pool_size": flask_app.config["DB_POOL_SIZE"], "max_overflow": flask_app.config["DB_MAX_OVERFLOW"], "pool_timeout": 5, "pool_recycle": 3600, "pool_pre_ping": True}
+
+def _configure_vital_settings(flask_app, env):
+    # returns True if any vital setting is missing
+    vital_settings = [("SERVER_MODE", None, [SERVER_MODE_WAVES, SERVER_MODE_PAYDB]), ("DEEP_LINK_SCHEME",)]
+    if env.get("SERVER_MODE") == SERVER_MODE_WAVES:
+        vital_settings += [("ASSET_NAME",), ("NODE_BASE_URL",), ("WALLET_SEED",), ("WALLET_ADDRESS",), ("ASSET_ID",), ("ASSET_MASTER_PUBKEY",), ("TX_SIGNERS",)]
+    else: # paydb
+        vital_settings += [("ASSET_NAME",), ("OPERATIONS_ACCOUNT",)]
+    vital_settings += [("ADMIN_EMAIL",), ("FROM_EMAIL", "SECURITY_EMAIL_SENDER"), ("FROM_NAME",),
+        ("SESSION_KEY", "SECRET_KEY"), ("PASSWORD_SALT", "SECURITY_PASSWORD_SALT"), ("SENDGRID_API_KEY", "MAIL_SENDGRID_API_KEY"),
+        ("SERVER_NAME",), ("FIREBASE_CREDENTIALS",)]
+    missing_vital_setting = False
+    for args in vital_settings:
+        if not set_vital_setting(flask_app, env, *args):
+            missing_vital_setting = True
+
+    if flask_app.config.get("SERVER_MODE") == SERVER_MODE_WAVES:
+        if flask_app.config["TESTNET"]:
+            flask_app.config["WAVESEXPLORER"] = 'https://testnet.wavesexplorer.com'
+        else:
+            flask_app.config["WAVESEXPLORER"] = 'https://wavesexplorer.com'
+        try:
+            flask_app.config["TX_SIGNERS"] = json.loads(flask_app.config["TX_SIGNERS"])
+        except:
+            raise Exception('TX_SIGNERS is not valid json') from None
+
+        # set pywaves to offline mode and testnet
+        pywaves.setOffline()
+        if flask_app.config["TESTNET"]:
+            pywaves.setChain("testnet")
+
+    return missing_vital_setting
+
+def create_app(env=None):
+    # returns the configured flask app and whether any vital setting is missing
+    if env is None:
+        env = os.environ
+    flask_app = Flask(__name__)
+    flask_app.wsgi_app = ProxyFix(flask_app.wsgi_app)
+    all_origins = {"origins": "*"}
+    CORS(flask_app, resources={r"/paydb/*": all_origins, r"/reward/*": all_origins, r"/payment_create": all_origins})
+
+    if env.get("DEBUG"):
+        flask_app.config["DEBUG"] = True
+
+    flask_app.config.from_pyfile("flask_config.py")
+
+    for name in FLAG_SETTINGS:
+        flask_app.config[name] = bool(env.get(name))
+    for name, default in INT_SETTINGS.items():
+        value = env.get(name)
+        flask_app.config[name] = int(value) if value else default
+    for name, default in STR_SETTINGS.items():
+        flask_app.config[name] = env.get(name) or default
+    #REFERRAL_REWARD_TYPE_SENDER is not configurable yet
+    flask_app.config["REFERRAL_REWARD_TYPE_SENDER"] = 'fixed'
+
+    _configure_database(flask_app, env)
+    server_name = env.get("SERVER_NAME")
+    if not flask_app.config["LOGO_URL_SRC"]:
+        flask_app.config["LOGO_URL_SRC"] = "http://" + server_name + "/static/assets/img/logo.svg"
+    if not flask_app.config["LOGO_EMAIL_SRC"]:
+        flask_app.config["LOGO_EMAIL_SRC"] = "http://" + server_name + "/static/assets/img/logo.png"
+
+    missing_vital_setting = _configure_vital_settings(flask_app, env)
+    return flask_app, missing_vital_setting
 
+# Create Flask application
+app, MISSING_VITAL_SETTING = create_app()
 db = SQLAlchemy(app)
 mail = MailSendGrid(app)
 socketio = SocketIO(app, cors_allowed_origins='*')
@@ -28,6 +28,7 @@ from marshmallow import Schema, fields
 from markupsafe import Markup
 from sqlalchemy import or_, and_
 from sqlalchemy.exc import SQLAlchemyError, DBAPIError
+from sqlalchemy.orm import aliased
 
 from app_core import app, db
 from utils import generate_key, is_email, is_mobile, is_address, sha256, int2asset
@@ -193,6 +194,11 @@ class Permission(db.Model):
     def from_name(cls, session, name):
         return session.query(cls).filter(cls.name == name).first()
 
+    @classmethod
+    def from_names(cls, session, names):
+        # pylint: disable=no-member
+        return session.query(cls).filter(cls.name.in_(names)).all()
+
     def __str__(self):
         return f'{self.name}'
 
@@ -217,10 +223,8 @@ class ApiKey(db.Model):
         self.expiry = datetime.datetime.now() + datetime.timedelta(30)
 
     def has_permission(self, permission_name):
-        perm = Permission.from_name(db.session, permission_name)
-        if perm:
-            return perm in self.permissions # pylint: disable=unsupported-membership-test
-        return False
+        # pylint: disable=not-an-iterable
+        return any(perm.name == permission_name for perm in self.permissions)
 
     @classmethod
     def from_token(cls, session, token):
@@ -256,13 +260,19 @@ class ApiKeyRequest(db.Model):
 class PayDbTransactionSchema(Schema):
     token = fields.String()
     date = fields.String()
-    timestamp = fields.Integer()
+    timestamp = fields.Method('get_timestamp')
     action = fields.String()
     sender = fields.String()
     recipient = fields.String()
     amount = fields.Integer()
     attachment = fields.String()
 
+    def get_timestamp(self, obj):
+        # computed from the date so plain result rows can be dumped too
+        if not obj.date:
+            return 0
+        return int(datetime.datetime.timestamp(obj.date))
+
 class PayDbTransaction(db.Model):
     ACTION_ISSUE = "issue"
     ACTION_TRANSFER = "transfer"
@@ -288,20 +298,22 @@ class PayDbTransaction(db.Model):
         self.amount = amount
         self.attachment = attachment
 
-    @property
-    def timestamp(self):
-        if not self.date:
-            return 0
-        return int(datetime.datetime.timestamp(self.date))
-
     @classmethod
     def from_token(cls, session, token):
         return session.query(cls).filter(cls.token == token).first()
 
     @classmethod
-    def related_to_user(cls, session, user, offset, limit):
+    def related_to_user_json(cls, session, user, offset, limit):
+        # query just the json columns (with the sender/recipient emails) instead of loading the transaction and user objects
         # pylint: disable=no-member
-        return session.query(cls).filter(or_(cls.sender_token == user.token, cls.recipient_token == user.token)).order_by(cls.id.desc()).offset(offset).limit(limit)
+        sender = aliased(User)
+        recipient = aliased(User)
+        rows = session.query(cls.token, cls.date, cls.action, sender.email.label('sender'), recipient.email.label('recipient'), cls.amount, cls.attachment) \
+            .join(sender, cls.sender_token == sender.token) \
+            .outerjoin(recipient, cls.recipient_token == recipient.token) \
+            .filter(or_(cls.sender_token == user.token, cls.recipient_token == user.token)).order_by(cls.id.desc()).offset(offset).limit(limit)
+        tx_schema = PayDbTransactionSchema(many=True)
+        return tx_schema.dump(rows)
 
     @classmethod
     def all(cls, session):
@@ -1188,6 +1200,10 @@ class UserStash(db.Model):
     def from_email_hash(cls, session, key, email_hash):
         return session.query(cls).filter(and_(cls.key == key, cls.email_hash == email_hash)).first()
 
+    @classmethod
+    def exists_for_email_hash(cls, session, key, email_hash):
+        return session.query(session.query(cls).filter(and_(cls.key == key, cls.email_hash == email_hash)).exists()).scalar()
+
 class UserStashRequest(db.Model):
     MINUTES_EXPIRY = 30
     ACTION_SAVE = 'save'
@@ -12,7 +12,7 @@ from app_core import app, db, limiter
 from models import WavesTx, WavesTxSig
 import utils
 import tx_utils
-from web_utils import bad_request, get_json_params
+from web_utils import bad_request, get_json_params, request_get_json_params
 
 logger = logging.getLogger(__name__)
 mw = Blueprint('mw', __name__, template_folder='templates')
@@ -120,10 +120,7 @@ def tx_create():
 
 @app.route("/tx_status", methods=["POST"])
 def tx_status():
-    content = request.get_json(force=True)
-    if content is None:
-        return bad_request("failed to decode JSON object")
-    params, err_response = get_json_params(content, ["txid"])
+    params, err_response = request_get_json_params(["txid"], "failed to decode JSON object")
     if err_response:
         return err_response
     txid, = params
@@ -135,10 +132,7 @@ def tx_status():
 
 @app.route("/tx_serialize", methods=["POST"])
 def tx_serialize():
-    content = request.get_json(force=True)
-    if content is None:
-        return bad_request("failed to decode JSON object")
-    params, err_response = get_json_params(content, ["tx"])
+    params, err_response = request_get_json_params(["tx"], "failed to decode JSON object")
     if err_response:
         return err_response
     tx, = params
@@ -150,10 +144,7 @@ def tx_serialize():
 
 @app.route("/tx_signature", methods=["POST"])
 def tx_signature():
-    content = request.get_json(force=True)
-    if content is None:
-        return bad_request("failed to decode JSON object")
-    params, err_response = get_json_params(content, ["txid", "signer_index", "signature"])
+    params, err_response = request_get_json_params(["txid", "signer_index", "signature"], "failed to decode JSON object")
     if err_response:
         return err_response
     txid, signer_index, signature = params
@@ -169,10 +160,7 @@ def tx_signature():
 
 @app.route("/tx_broadcast", methods=["POST"])
 def tx_broadcast():
-    content = request.get_json(force=True)
-    if content is None:
-        return bad_request("failed to decode JSON object")
-    params, err_response = get_json_params(content, ["txid"])
+    params, err_response = request_get_json_params(["txid"], "failed to decode JSON object")
     if err_response:
         return err_response
     txid, = params
@@ -1,7 +1,6 @@
 # pylint: disable=unbalanced-tuple-unpacking
 
 import logging
-import time
 import datetime
 import json
 
@@ -10,9 +9,10 @@ import flask_security
 from flask_security.utils import encrypt_password, verify_password
 from flask_security.recoverable import send_reset_password_instructions
 from flask_socketio import Namespace, emit, join_room, leave_room
+from flask_limiter.util import get_remote_address
 
 import web_utils
-from web_utils import bad_request, get_json_params, request_get_signature, check_auth, auth_request, auth_request_get_single_param
+from web_utils import bad_request, request_get_json_params, request_get_signature, check_auth, auth_request, auth_request_get_single_param, failed_request_limit
 import utils
 from app_core import db, socketio, limiter
 from models import user_datastore, User, UserCreateRequest, UserUpdateEmailRequest, Permission, ApiKey, ApiKeyRequest, PayDbTransaction
@@ -22,6 +22,20 @@ logger = logging.getLogger(__name__)
 paydb = Blueprint('paydb', __name__, template_folder='templates')
 limiter.limit('100/minute')(paydb)
 ws_sids = {}
+ws_email_sids = {}
+
+def failed_request_key(param_name):
+    # rate limit key of the client address and a json request parameter
+    def key_func():
+        content = request.get_json(force=True, silent=True)
+        value = content.get(param_name) if isinstance(content, dict) else None
+        return f'{get_remote_address()}:{value}'
+    return key_func
+
+# slow down brute force attempts, only failed requests count towards this limit
+FAILED_REQUEST_LIMIT = '5/minute;50/hour'
+failed_email_limit = failed_request_limit(limiter, FAILED_REQUEST_LIMIT, failed_request_key('email'))
+failed_api_key_limit = failed_request_limit(limiter, FAILED_REQUEST_LIMIT, failed_request_key('api_key'))
 
 #
 # Websocket events
@@ -30,10 +44,28 @@ ws_sids = {}
 NS = '/paydb'
 
 def tx_event(txn):
-    txt = json.dumps(txn.to_json())
-    socketio.emit("tx", txt, json=True, room=txn.sender.email, namespace=NS)
+    # only emit to rooms that have an authenticated websocket
+    emails = [txn.sender.email]
     if txn.recipient and txn.recipient != txn.sender:
-        socketio.emit("tx", txt, json=True, room=txn.recipient.email, namespace=NS)
+        emails.append(txn.recipient.email)
+    emails = [email for email in emails if email in ws_email_sids]
+    if not emails:
+        return
+    txt = json.dumps(txn.to_json())
+    for email in emails:
+        socketio.emit("tx", txt, json=True, room=email, namespace=NS)
+
+def ws_sid_remove(sid):
+    # remove the sid -> email and email -> sids entries for a websocket
+    # (relies on gevent not switching greenlets between these calls, none of them yield)
+    email = ws_sids.pop(sid, None)
+    if email:
+        logger.info("leave room for email: %s", email)
+        leave_room(email)
+        sids = ws_email_sids.get(email, set())
+        sids.discard(sid)
+        if not sids:
+            ws_email_sids.pop(email, None)
 
 class PayDbNamespace(Namespace):
 
@@ -48,22 +80,20 @@ class PayDbNamespace(Namespace):
         res, reason, api_key = check_auth(db.session, auth["api_key"], auth["nonce"], auth["signature"], str(auth["nonce"]))
         if res:
             emit("info", "authenticated!", namespace=NS)
+            # remove any previous user for this sid
+            ws_sid_remove(request.sid)
             # join room and store user
             logger.info("join room for email: %s", api_key.user.email)
             join_room(api_key.user.email)
-            # store sid -> email map
+            # store sid -> email and email -> sids maps
             ws_sids[request.sid] = api_key.user.email
+            ws_email_sids.setdefault(api_key.user.email, set()).add(request.sid)
         else:
             logger.info("failed authentication (%s): %s", auth["api_key"], reason)
 
     def on_disconnect(self):
         logger.info("disconnect sid: %s", request.sid)
-        if request.sid in ws_sids:
-            # remove sid -> email map
-            email = ws_sids[request.sid]
-            logger.info("leave room for email: %s", email)
-            leave_room(email)
-            del ws_sids[request.sid]
+        ws_sid_remove(request.sid)
 
 socketio.on_namespace(PayDbNamespace(NS))
 
@@ -72,12 +102,10 @@ socketio.on_namespace(PayDbNamespace(NS))
 #
 
 @paydb.route('/user_register', methods=['POST'])
+@failed_email_limit
 @limiter.limit('10/hour')
 def user_register():
-    content = request.get_json(force=True)
-    if content is None:
-        return bad_request(web_utils.INVALID_JSON)
-    params, err_response = get_json_params(content, ["email", "password", "first_name", "last_name", "mobile_number", "address", "photo", "photo_type"])
+    params, err_response = request_get_json_params(["email", "password", "first_name", "last_name", "mobile_number", "address", "photo", "photo_type"])
     if err_response:
         return err_response
     email, password, first_name, last_name, mobile_number, address, photo, photo_type = params
@@ -91,7 +119,6 @@ def user_register():
     req = UserCreateRequest(first_name, last_name, email, mobile_number, address, photo, photo_type, encrypt_password(password))
     user = User.from_email(db.session, email)
     if user:
-        time.sleep(5)
         return bad_request(web_utils.USER_EXISTS)
     utils.email_user_create_request(logger, req, req.MINUTES_EXPIRY)
     db.session.add(req)
@@ -125,12 +152,10 @@ def user_registration_confirm(token=None):
     return redirect('/')
 
 @paydb.route('/api_key_create', methods=['POST'])
+@failed_email_limit
 @limiter.limit('10/hour')
 def api_key_create():
-    content = request.get_json(force=True)
-    if content is None:
-        return bad_request(web_utils.INVALID_JSON)
-    params, err_response = get_json_params(content, ["email", "password", "device_name"])
+    params, err_response = request_get_json_params(["email", "password", "device_name"])
     if err_response:
         return err_response
     email, password, device_name = params
@@ -139,15 +164,11 @@ def api_key_create():
     email = email.lower()
     user = User.from_email(db.session, email)
     if not user:
-        time.sleep(5)
         return bad_request(web_utils.AUTH_FAILED)
     if not flask_security.verify_password(password, user.password):
-        time.sleep(5)
         return bad_request(web_utils.AUTH_FAILED)
     api_key = ApiKey(user, device_name)
-    for name in Permission.PERMS_ALL:
-        perm = Permission.from_name(db.session, name)
-        api_key.permissions.append(perm)
+    api_key.permissions.extend(Permission.from_names(db.session, Permission.PERMS_ALL))
     db.session.add(api_key)
     db.session.commit()
     return jsonify(dict(token=api_key.token, secret=api_key.secret, device_name=api_key.device_name, expiry=api_key.expiry))
@@ -155,10 +176,7 @@ def api_key_create():
 @paydb.route('/api_key_request', methods=['POST'])
 @limiter.limit('10/hour')
 def api_key_request():
-    content = request.get_json(force=True)
-    if content is None:
-        return bad_request(web_utils.INVALID_JSON)
-    params, err_response = get_json_params(content, ["email", "device_name"])
+    params, err_response = request_get_json_params(["email", "device_name"])
     if err_response:
         return err_response
     email, device_name = params
@@ -178,20 +196,14 @@ def api_key_request():
 @paydb.route('/api_key_claim', methods=['POST'])
 @limiter.limit('20/minute')
 def api_key_claim():
-    content = request.get_json(force=True)
-    if content is None:
-        return bad_request(web_utils.INVALID_JSON)
-    params, err_response = get_json_params(content, ["token"])
+    params, err_response = request_get_json_params(["token"])
     if err_response:
         return err_response
     token, = params
     req = ApiKeyRequest.from_token(db.session, token)
-    if not token:
-        time.sleep(5)
+    if not req:
         return bad_request(web_utils.NOT_FOUND)
-    req = ApiKeyRequest.from_token(db.session, token)
     if not req.created_api_key:
-        time.sleep(5)
         return bad_request(web_utils.NOT_CREATED)
     api_key = req.created_api_key
     db.session.delete(req)
@@ -203,7 +215,6 @@ def api_key_claim():
 def api_key_confirm(token=None, secret=None):
     req = ApiKeyRequest.from_token(db.session, token)
     if not req:
-        time.sleep(5)
         flash('Email login request not found.', 'danger')
         return redirect('/')
     if req.secret != secret:
@@ -211,7 +222,6 @@ def api_key_confirm(token=None, secret=None):
         return redirect('/')
     now = datetime.datetime.now()
     if now > req.expiry:
-        time.sleep(5)
         flash('Email login request expired.', 'danger')
         return redirect('/')
     if request.method == 'POST':
@@ -223,9 +233,8 @@ def api_key_confirm(token=None, secret=None):
             return redirect('/')
         perms = request.form.getlist('perms')
         api_key = ApiKey(req.user, req.device_name)
-        for name in perms:
-            perm = Permission.from_name(db.session, name)
-            api_key.permissions.append(perm)
+        if perms:
+            api_key.permissions.extend(Permission.from_names(db.session, perms))
         req.created_api_key = api_key
         db.session.add(req)
         db.session.add(api_key)
@@ -235,17 +244,17 @@ def api_key_confirm(token=None, secret=None):
     return render_template('paydb/api_key_confirm.html', req=req, perms=Permission.PERMS_ALL)
 
 @paydb.route('/user_info', methods=['POST'])
+@failed_api_key_limit
 def user_info():
     email, api_key, err_response = auth_request_get_single_param(db, "email")
     if err_response:
         return err_response
     if not email:
-        email = api_key.user.email
+        # no need to lookup the api key user
+        user = api_key.user
     else:
-        email = email.lower()
-    user = User.from_email(db.session, email)
+        user = User.from_email(db.session, email.lower())
     if not user:
-        time.sleep(5)
         return bad_request(web_utils.AUTH_FAILED)
     if user == api_key.user:
         balance = paydb_core.user_balance(db.session, api_key)
@@ -265,6 +274,7 @@ def user_reset_password():
     return 'ok'
 
 @paydb.route('/user_update_email', methods=['POST'])
+@failed_api_key_limit
 @limiter.limit('10/hour')
 def user_update_email():
     email, api_key, err_response = auth_request_get_single_param(db, "email")
@@ -275,7 +285,6 @@ def user_update_email():
     email = email.lower()
     user = User.from_email(db.session, email)
     if user:
-        time.sleep(5)
         return bad_request(web_utils.USER_EXISTS)
     req = UserUpdateEmailRequest(api_key.user, email)
     utils.email_user_update_email_request(logger, req, req.MINUTES_EXPIRY)
@@ -296,7 +305,6 @@ def user_update_email_confirm(token=None):
         return redirect('/')
     user = User.from_email(db.session, req.email)
     if user:
-        time.sleep(5)
         return bad_request(web_utils.USER_EXISTS)
     user = req.user
     user.email = req.email
@@ -310,10 +318,7 @@ def user_update_email_confirm(token=None):
 @limiter.limit('10/hour')
 def user_update_password():
     sig = request_get_signature()
-    content = request.get_json(force=True)
-    if content is None:
-        return bad_request(web_utils.INVALID_JSON)
-    params, err_response = get_json_params(content, ["api_key", "nonce", "current_password", "new_password"])
+    params, err_response = request_get_json_params(["api_key", "nonce", "current_password", "new_password"])
     if err_response:
         return err_response
     api_key, nonce, current_password, new_password = params
@@ -334,10 +339,7 @@ def user_update_password():
 @limiter.limit('10/hour')
 def user_update_photo():
     sig = request_get_signature()
-    content = request.get_json(force=True)
-    if content is None:
-        return bad_request(web_utils.INVALID_JSON)
-    params, err_response = get_json_params(content, ["api_key", "nonce", "photo", "photo_type"])
+    params, err_response = request_get_json_params(["api_key", "nonce", "photo", "photo_type"])
     if err_response:
         return err_response
     api_key, nonce, photo, photo_type = params
@@ -354,10 +356,7 @@ def user_update_photo():
 @paydb.route('/user_transactions', methods=['POST'])
 def user_transactions():
     sig = request_get_signature()
-    content = request.get_json(force=True)
-    if content is None:
-        return bad_request(web_utils.INVALID_JSON)
-    params, err_response = get_json_params(content, ["api_key", "nonce", "offset", "limit"])
+    params, err_response = request_get_json_params(["api_key", "nonce", "offset", "limit"])
     if err_response:
         return err_response
     api_key, nonce, offset, limit = params
@@ -368,17 +367,13 @@ def user_transactions():
         return bad_request(reason)
     if not api_key.has_permission(Permission.PERMISSION_HISTORY):
         return bad_request(web_utils.UNAUTHORIZED)
-    txs = PayDbTransaction.related_to_user(db.session, api_key.user, offset, limit)
-    txs = [tx.to_json() for tx in txs]
+    txs = PayDbTransaction.related_to_user_json(db.session, api_key.user, offset, limit)
     return jsonify(dict(txs=txs))
 
 @paydb.route('/transaction_create', methods=['POST'])
 def transaction_create():
     sig = request_get_signature()
-    content = request.get_json(force=True)
-    if content is None:
-        return bad_request(web_utils.INVALID_JSON)
-    params, err_response = get_json_params(content, ["api_key", "nonce", "action", "recipient", "amount", "attachment"])
+    params, err_response = request_get_json_params(["api_key", "nonce", "action", "recipient", "amount", "attachment"])
     if err_response:
         return err_response
     api_key, nonce, action, recipient, amount, attachment = params
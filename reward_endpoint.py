@@ -6,7 +6,7 @@ import time
 from flask import Blueprint, request, jsonify
 
 import web_utils
-from web_utils import bad_request, get_json_params, request_get_signature, check_auth, auth_request, auth_request_get_single_param
+from web_utils import bad_request, request_get_json_params, request_get_signature, check_auth, auth_request, auth_request_get_single_param
 import utils
 from app_core import app, db, limiter
 from models import User, Role, Category, Proposal, Payment, Referral
@@ -35,10 +35,7 @@ def _reward_create(user, reason, category, recipient, amount, message):
 @reward.route("/reward_categories", methods=["POST"])
 def reward_categories():
     sig = request_get_signature()
-    content = request.get_json(force=True)
-    if content is None:
-        return bad_request(web_utils.INVALID_JSON)
-    params, err_response = get_json_params(content, ["api_key", "nonce"])
+    params, err_response = request_get_json_params(["api_key", "nonce"])
     if err_response:
         return err_response
     api_key, nonce = params
@@ -55,10 +52,7 @@ def reward_categories():
 @reward.route("/reward_create", methods=["POST"])
 def reward_create():
     sig = request_get_signature()
-    content = request.get_json(force=True)
-    if content is None:
-        return bad_request(web_utils.INVALID_JSON)
-    params, err_response = get_json_params(content, ["api_key", "nonce", "reason", "category", "recipient", "amount", "message"])
+    params, err_response = request_get_json_params(["api_key", "nonce", "reason", "category", "recipient", "amount", "message"])
     if err_response:
         return err_response
     api_key, nonce, reason, category, recipient, amount, message = params
@@ -9,24 +9,20 @@ from flask import Blueprint, render_template, request, jsonify, flash, redirect
 from app_core import db
 from models import UserStash, UserStashRequest
 import utils
-from web_utils import bad_request, get_json_params
-import web_utils
+from web_utils import request_get_json_params
 
 logger = logging.getLogger(__name__)
 stash_bp = Blueprint('stash_bp', __name__, template_folder='templates')
 
 @stash_bp.route('/save', methods=['POST'])
 def stash_save():
-    content = request.get_json(force=True)
-    if content is None:
-        return bad_request(web_utils.INVALID_JSON)
-    params, err_response = get_json_params(content, ["key", "email", "iv", "cyphertext", "question"])
+    params, err_response = request_get_json_params(["key", "email", "iv", "cyphertext", "question"])
     if err_response:
         return err_response
     key, email, iv, cyphertext, question = params
-    stash = UserStash.from_email_hash(db.session, key, utils.sha256(email))
+    stash_exists = UserStash.exists_for_email_hash(db.session, key, utils.sha256(email))
     req = UserStashRequest(key, email, iv, cyphertext, question, UserStashRequest.ACTION_SAVE)
-    if not stash:
+    if not stash_exists:
         db.session.add(req)
         db.session.commit()
         utils.email_stash_save_request(logger, email, req, req.MINUTES_EXPIRY)
@@ -41,7 +37,7 @@ def stash_save_check(token=None):
     req = UserStashRequest.from_token(db.session, token)
     if not req:
         return jsonify(dict(confirmed=False))
-    return jsonify(dict(confirmed=req.created_stash is not None))
+    return jsonify(dict(confirmed=req.created_stash_id is not None))
 
 @stash_bp.route('/save_confirm/<token>/<secret>', methods=['GET', 'POST'])
 def stash_save_confirm(token=None, secret=None):
@@ -80,10 +76,7 @@ def stash_save_confirm(token=None, secret=None):
 
 @stash_bp.route('/load', methods=['POST'])
 def stash_load():
-    content = request.get_json(force=True)
-    if content is None:
-        return bad_request(web_utils.INVALID_JSON)
-    params, err_response = get_json_params(content, ["key", "email"])
+    params, err_response = request_get_json_params(["key", "email"])
     if err_response:
         return err_response
     key, email = params
@@ -0,0 +1,42 @@
+import pytest
+from flask import Flask, request
+from flask_limiter import Limiter
+from flask_limiter.util import get_remote_address
+
+import web_utils
+
+@pytest.fixture
+def client():
+    app = Flask(__name__)
+    limiter = Limiter(app, key_func=get_remote_address, headers_enabled=True)
+    failed_limit = web_utils.failed_request_limit(limiter, '2/minute', lambda: get_remote_address() + ':' + str(request.args.get('email')))
+
+    @app.route('/login', methods=['POST'])
+    @failed_limit
+    @limiter.limit('10/hour')
+    def login():
+        if request.args.get('fail'):
+            return web_utils.bad_request(web_utils.AUTH_FAILED)
+        return 'ok'
+
+    return app.test_client()
+
+def test_success_headers_report_route_limit(client):
+    response = client.post('/login')
+    assert response.status_code == 200
+    assert response.headers['X-RateLimit-Limit'] == '10'
+    assert response.headers['X-RateLimit-Remaining'] == '9'
+    assert 3500 < int(response.headers['Retry-After']) <= 3600
+
+def test_successes_do_not_count(client):
+    for _ in range(5):
+        assert client.post('/login').status_code == 200
+
+def test_failures_are_limited(client):
+    assert client.post('/login?fail=1').status_code == 400
+    assert client.post('/login?fail=1').status_code == 400
+    response = client.post('/login')
+    assert response.status_code == 429
+    assert response.get_json()['message'] == web_utils.TOO_MANY_FAILED_REQUESTS
+    # other keys are not affected
+    assert client.post('/login?email=other').status_code == 200
@@ -120,8 +120,10 @@ def email_stash_load_request(logger, email, req, minutes_expiry):
 def generate_key(num=20):
     return binascii.hexlify(os.urandom(num)).decode()
 
+EMAIL_RE = re.compile(r"[^@]+@[^@]+\.[^@]+")
+
 def is_email(val):
-    return re.match("[^@]+@[^@]+\.[^@]+", val) # pylint: disable=anomalous-backslash-in-string
+    return EMAIL_RE.match(val) is not None
 
 def is_mobile(val):
     return val.isnumeric()
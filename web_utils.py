@@ -2,8 +2,10 @@ import hmac
 import hashlib
 import base64
 import logging
+import functools
 
-from flask import jsonify, request
+from flask import jsonify, request, make_response
+from limits import parse_many
 
 logger = logging.getLogger(__name__)
 
@@ -24,6 +26,7 @@ INCORRECT_PASSWORD = 'incorrect password'
 NOT_IMPLEMENTED  = 'net yet implemented'
 NOT_AVAILABLE = 'not available'
 INVALID_AMOUNT = 'invalid amount'
+TOO_MANY_FAILED_REQUESTS = 'too many failed requests'
 
 def bad_request(message, code=400):
     logger.warning(message)
@@ -31,6 +34,27 @@ def bad_request(message, code=400):
     response.status_code = code
     return response
 
+def failed_request_limit(limiter, limit_value, key_func):
+    # only failed (status >= 400) responses count towards these limits, they are checked here instead of
+    # with limiter.limit(deduct_when=...) so the rate limit headers keep reporting the route limits
+    limits = parse_many(limit_value)
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not limiter.enabled:
+                return func(*args, **kwargs)
+            identifiers = ['failed_request', request.endpoint, key_func()]
+            for lim in limits:
+                if not limiter.limiter.test(lim, *identifiers):
+                    return bad_request(TOO_MANY_FAILED_REQUESTS, 429)
+            response = make_response(func(*args, **kwargs))
+            if response.status_code >= 400:
+                for lim in limits:
+                    limiter.limiter.hit(lim, *identifiers)
+            return response
+        return wrapper
+    return decorator
+
 def get_json_params(json_content, param_names):
     param_values = []
     param_name = ''
@@ -44,6 +68,12 @@ def get_json_params(json_content, param_names):
         return param_values, bad_request(f"'{param_name}' not found")
     return param_values, None
 
+def request_get_json_params(param_names, invalid_json_message=INVALID_JSON):
+    content = request.get_json(force=True)
+    if content is None:
+        return None, bad_request(invalid_json_message)
+    return get_json_params(content, param_names)
+
 def get_json_params_optional(json_content, param_names):
     param_values = []
     for param in param_names:
@@ -58,8 +88,15 @@ def to_bytes(data):
         return data.encode("utf-8")
     return data
 
+@functools.lru_cache(maxsize=128)
+def _keyed_hmac(api_secret):
+    # shared keyed hmac state (saves hashing the key on every request), only use copies of it
+    # the cache is kept small so few secrets of old api keys are held in memory
+    return hmac.new(to_bytes(api_secret), digestmod=hashlib.sha256)
+
 def create_hmac_sig(api_secret, message):
-    _hmac = hmac.new(to_bytes(api_secret), msg=to_bytes(message), digestmod=hashlib.sha256)
+    _hmac = _keyed_hmac(api_secret).copy()
+    _hmac.update(to_bytes(message))
     signature = _hmac.digest()
     signature = base64.b64encode(signature).decode("utf-8")
     return signature
@@ -71,7 +108,7 @@ def check_hmac_auth(api_key, nonce, sig, body):
     if nonce <= api_key.nonce:
         return False, OLD_NONCE
     our_sig = create_hmac_sig(api_key.secret, body)
-    if sig == our_sig:
+    if sig and hmac.compare_digest(to_bytes(sig), to_bytes(our_sig)):
         api_key.nonce = nonce
         return True, ""
     return False, AUTH_FAILED
@@ -95,10 +132,7 @@ def check_auth(session, api_key_token, nonce, sig, body):
 # pylint: disable=invalid-name
 def auth_request(db):
     sig = request_get_signature()
-    content = request.get_json(force=True)
-    if content is None:
-        return None, bad_request(INVALID_JSON)
-    params, err_response = get_json_params(content, ["api_key", "nonce"])
+    params, err_response = request_get_json_params(["api_key", "nonce"])
     if err_response:
         return None, err_response
     api_key, nonce = params
@@ -111,10 +145,7 @@ def auth_request(db):
 # pylint: disable=invalid-name
 def auth_request_get_single_param(db, param_name):
     sig = request_get_signature()
-    content = request.get_json(force=True)
-    if content is None:
-        return None, None, bad_request(INVALID_JSON)
-    params, err_response = get_json_params(content, ["api_key", "nonce", param_name])
+    params, err_response = request_get_json_params(["api_key", "nonce", param_name])
     if err_response:
         return None, None, err_response
     api_key, nonce, param = params